@@ -5,18 +5,27 @@ Sistema de almacenamiento en la nube usando Telegram con enlaces cortos.
 """
 
 import os
-import json
+import orjson
 import hashlib
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_toolbelt import MultipartEncoder
 from datetime import datetime
 from pathlib import Path
 import tempfile
 import zipfile
-import io
+import shutil
 import logging
+import re
 import base64
 import zlib
+import gzip
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
 
 # Configuración
 logging.basicConfig(level=logging.INFO)
@@ -28,33 +37,180 @@ st.set_page_config(
     layout="wide"
 )
 
-INDEX_FILENAME = "_telegram_cloud_index.json"
+TELEGRAM_API = "https://api.telegram.org"
+INDEX_FILENAME = "_telegram_cloud_index.json.gz"
+LEGACY_INDEX_FILENAME = "_telegram_cloud_index.json"  # Índices sin comprimir (solo lectura)
+INDEX_NOT_LOADED_MESSAGE = "No se pudo cargar el índice desde Telegram; pulsa Sincronizar para reintentar"
+CHUNK_SIZE = 1024 * 1024  # 1 MiB por lectura al hashear/subir
+MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB límite de Telegram
+ZIP_SPOOL_SIZE = 64 * 1024 * 1024  # ZIPs mayores se vuelcan a disco
+ZIP_COMPRESS_LEVEL = 1  # DEFLATE rápido: la ganancia de niveles altos no compensa el tiempo
+# Formatos ya comprimidos: se guardan sin comprimir (ZIP_STORED)
+INCOMPRESSIBLE_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.aac', '.ogg', '.opus', '.flac', '.m4a',
+    '.mp4', '.mkv', '.mov', '.avi', '.webm',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.apk', '.epub'
+}
+DOWNLOAD_CACHE_SIZE = 1024 * 1024 * 1024  # 1GB de descargas cacheadas por usuario
+# Los file_id de Telegram son base64url: cualquier otra cosa (p. ej. '..' o '/') se rechaza
+FILE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+UPLOAD_WORKERS = 4  # Subidas simultáneas en "Subir Todos"
+# (conexión, lectura): tras enviar un archivo grande Telegram puede tardar en responder
+UPLOAD_TIMEOUT = (30, 600)
+MAX_CLIENTS = 16  # Clientes (token -> índice en memoria) que se conservan a la vez
+MAX_UPLOAD_HASHES = 256  # Hashes de subidas recientes que se recuerdan por cliente
+MAX_CACHED_VIEWS = 32  # Vistas ordenadas/filtradas que se conservan por versión del índice
+PAGE_SIZE = 100  # Filas por página en "Mis Archivos"
+
+SORT_KEYS = {
+    'date': lambda item: item[1]['upload_ts'],
+    'size': lambda item: item[1]['size'],
+    'name': lambda item: item[0].lower()
+}
+
+@st.cache_resource
+def get_http_session():
+    """Sesión HTTP compartida: reutiliza conexiones TLS con api.telegram.org"""
+    session = requests.Session()
+    # Solo se reintentan métodos idempotentes (GET); los POST de subida no se repiten
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(16, UPLOAD_WORKERS * 2), max_retries=retry)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'telegram-cloud-storage'
+    return session
+
+@st.cache_resource
+def get_upload_executor():
+    """Pool de hilos para subidas en segundo plano (compartido por todas las sesiones)"""
+    return ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+# Las respuestas de getMe/getUpdates se cachean entre reruns de Streamlit.
+# Solo se cachean respuestas recibidas: los errores de red lanzan excepción
+# y se reintentan en el siguiente rerun.
+@st.cache_data(ttl=300, max_entries=64, show_spinner=False)
+def _cached_get_me(bot_token):
+    response = get_http_session().get(f"{TELEGRAM_API}/bot{bot_token}/getMe", timeout=10)
+    return orjson.loads(response.content)
+
+@st.cache_data(ttl=15, show_spinner=False)
+def _cached_get_updates(bot_token):
+    response = get_http_session().get(f"{TELEGRAM_API}/bot{bot_token}/getUpdates", timeout=10)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+def _private_chat_label(chat):
+    name = chat.get('first_name', 'Usuario')
+    username = chat.get('username', '')
+    return f"👤 {name}" + (f" (@{username})" if username else "")
+
+def _group_chat_label(chat):
+    return f"👥 {chat.get('title', 'Grupo')}"
+
+def _channel_chat_label(chat):
+    return f"📢 {chat.get('title', 'Canal')}"
+
+# Tipo de chat -> etiqueta para el selector; otros tipos se ignoran
+CHAT_LABELS = {
+    'private': _private_chat_label,
+    'group': _group_chat_label,
+    'supergroup': _group_chat_label,
+    'channel': _channel_chat_label
+}
+
+def check_bot_token(bot_token):
+    """Verifica un token con getMe (cacheado) sin crear cliente ni directorios"""
+    try:
+        result = _cached_get_me(bot_token)
+        return result.get('ok', False), result.get('result', {})
+    except Exception as e:
+        logger.error(f"Error verificando token: {e}")
+        return False, {}
+
+class TelegramAPIError(Exception):
+    """La Bot API respondió con ok=false; el mensaje es su 'description'"""
 
 class TelegramCloudStorage:
     def __init__(self, bot_token):
         self.bot_token = bot_token
-        self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        self.base_url = f"{TELEGRAM_API}/bot{bot_token}"
+        self.session = get_http_session()
         self.user_hash = hashlib.md5(bot_token.encode()).hexdigest()[:16]
         
         # Directorio temporal para configuración
         self.user_dir = Path(tempfile.gettempdir()) / "telegram_cloud" / self.user_hash
         self.user_dir.mkdir(parents=True, exist_ok=True)
         self.config_file = self.user_dir / "config.json"
+        # Caché de descargas: un file_id de Telegram siempre apunta al mismo contenido
+        self.cache_dir = self.user_dir / "cache"
+        self.cache_dir.mkdir(exist_ok=True)
         
         self.config = self._load_config()
-        self.index = {}
+        self._index = None  # Se carga desde Telegram en el primer acceso
+        self._index_load_failed = False  # La carga perezosa falló: no reintentar en cada acceso
         self.index_message_id = None
-        
-        # Cargar índice si ya hay configuración
-        if self.config.get('chat_id'):
-            self.sync_index()
+        self._index_file_id = None  # file_id del documento de índice cargado/guardado
+        self._saved_index_bytes = None  # Último índice guardado, para no reenviarlo sin cambios
+        # Reentrante: la carga perezosa de `index` puede ocurrir con el candado ya tomado
+        self._index_lock = threading.RLock()
+        # Vistas precalculadas como (índice, valor): solo valen para esa versión del índice
+        self._views = (None, {})
+        self._stats = None
+        self._names_by_hash = None
+        self._sizes = None  # Tamaños presentes en el índice, para descartar duplicados sin hashear
+        self._folded_names = (None, {})  # nombre -> nombre en minúsculas para la búsqueda
+        self._upload_hashes = OrderedDict()  # file_id de UploadedFile -> hash, para reintentos (LRU)
+        self._upload_hashes_lock = threading.Lock()
+
+    def _api(self, method, http_method='GET', timeout=30, **kwargs):
+        """Llama a un método de la Bot API y devuelve su 'result'.
+
+        Lanza TelegramAPIError si Telegram responde ok=false y
+        requests.HTTPError si la respuesta ni siquiera es JSON (p. ej. un 502).
+        """
+        response = self.session.request(http_method, f"{self.base_url}/{method}", timeout=timeout, **kwargs)
+        try:
+            result = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            response.raise_for_status()
+            raise
+        if not result.get('ok'):
+            raise TelegramAPIError(result.get('description', f"HTTP {response.status_code}"))
+        return result['result']
+
+    @property
+    def index(self):
+        """Índice de archivos; se sincroniza con Telegram la primera vez que se usa.
+
+        Si la carga falla devuelve un dict vacío provisional que no se publica:
+        el cliente sigue sin índice cargado y las modificaciones se rechazan.
+        """
+        if self._index is None:
+            # Bajo el candado y sin publicar un índice vacío provisional: otra sesión
+            # que suba un archivo durante la carga esperará a que termine
+            with self._index_lock:
+                if self._index is None and not self._index_load_failed:
+                    if not self.config.get('chat_id'):
+                        self._set_index({})
+                    elif not self.sync_index():
+                        self._index_load_failed = True
+                if self._index is None:
+                    return {}
+        return self._index
+
+    @property
+    def index_loaded(self):
+        """Carga el índice si aún no se ha intentado e indica si está disponible"""
+        self.index
+        return self._index is not None
 
     def _load_config(self):
         """Carga configuración del usuario"""
         try:
             if self.config_file.exists():
-                with open(self.config_file, 'r') as f:
-                    return json.load(f)
+                with open(self.config_file, 'rb') as f:
+                    return orjson.loads(f.read())
         except Exception as e:
             logger.error(f"Error cargando configuración: {e}")
         return {}
@@ -67,96 +223,201 @@ class TelegramCloudStorage:
                 'chat_id': chat_id,
                 'user_hash': self.user_hash
             }
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=2)
-            self.config = config
+            # Temporal + rename: un fallo a mitad de escritura no deja un config corrupto
+            fd, tmp_path = tempfile.mkstemp(dir=self.user_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+                os.replace(tmp_path, self.config_file)
+            except BaseException:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+            with self._index_lock:
+                self.config = config
+                self._index = None  # Nuevo chat: recargar el índice en el próximo acceso
+                self._index_load_failed = False
+                self.index_message_id = None
+                self._index_file_id = None
+                self._saved_index_bytes = None
             return True
         except Exception as e:
             logger.error(f"Error guardando configuración: {e}")
             return False
 
+    def reset_config(self):
+        """Borra la configuración guardada y olvida el índice del chat anterior"""
+        self.config_file.unlink(missing_ok=True)
+        with self._index_lock:
+            self.config = {}
+            self._index = None
+            self._index_load_failed = False
+            self.index_message_id = None
+            self._index_file_id = None
+            self._saved_index_bytes = None
+
     def test_bot_token(self):
         """Verifica si el token es válido"""
-        try:
-            response = requests.get(f"{self.base_url}/getMe", timeout=10)
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('ok', False), result.get('result', {})
-            return False, {}
-        except Exception as e:
-            logger.error(f"Error verificando token: {e}")
-            return False, {}
+        return check_bot_token(self.bot_token)
 
     def get_chat_ids(self):
-        """Obtiene Chat IDs disponibles"""
+        """Obtiene los chats disponibles como {nombre a mostrar: chat_id}"""
         try:
-            response = requests.get(f"{self.base_url}/getUpdates", timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if data['ok'] and data['result']:
-                    chats = {}
-                    for update in data['result'][-10:]:  # Solo últimos 10 mensajes
-                        if 'message' in update:
-                            chat = update['message']['chat']
-                            chat_id = chat['id']
-                            chat_type = chat['type']
-                            
-                            if chat_type == 'private':
-                                name = chat.get('first_name', 'Usuario')
-                                username = chat.get('username', '')
-                                display = f"👤 {name}" + (f" (@{username})" if username else "")
-                            elif chat_type in ['group', 'supergroup']:
-                                display = f"👥 {chat.get('title', 'Grupo')}"
-                            elif chat_type == 'channel':
-                                display = f"📢 {chat.get('title', 'Canal')}"
-                            else:
-                                continue
-                            
-                            chats[chat_id] = display
-                    
-                    return list(chats.items())
-            return []
+            data = _cached_get_updates(self.bot_token)
+            chats = {}
+            seen = set()
+            if data['ok']:
+                # Últimos 10 mensajes, del más reciente al más antiguo: cada chat una vez
+                for update in reversed(data['result'][-10:]):
+                    if 'message' in update:
+                        chat = update['message']['chat']
+                        label = CHAT_LABELS.get(chat['type'])
+                        if label and chat['id'] not in seen:
+                            seen.add(chat['id'])
+                            chats[label(chat)] = chat['id']
+            return chats
         except Exception as e:
             logger.error(f"Error obteniendo chats: {e}")
-            return []
+            return {}
 
     def sync_index(self):
-        """Sincroniza el índice desde Telegram"""
+        """Sincroniza el índice desde Telegram.
+
+        Se ejecuta bajo _index_lock: las subidas esperan a que el índice
+        cargado se publique en vez de escribir sobre uno a medio cargar.
+        """
         if not self.config.get('chat_id'):
             return False
-            
-        try:
-            # Obtener mensaje fijado
-            response = requests.get(f"{self.base_url}/getChat", params={'chat_id': self.config['chat_id']})
-            if response.status_code != 200:
-                return False
+        
+        with self._index_lock:
+            try:
+                # Obtener mensaje fijado
+                chat = self._api('getChat', params={'chat_id': self.config['chat_id']})
+                pinned_message = chat.get('pinned_message')
+                if not pinned_message:
+                    self._set_index({})
+                    return True
 
-            chat_info = response.json()
-            if not chat_info.get('ok') or 'pinned_message' not in chat_info.get('result', {}):
-                self.index = {}
+                # Verificar si es nuestro archivo de índice
+                index_name = pinned_message.get('document', {}).get('file_name')
+                if index_name in (INDEX_FILENAME, LEGACY_INDEX_FILENAME):
+                    
+                    # Solo se recuerda el mensaje si es nuestro índice: save_index lo edita
+                    self.index_message_id = pinned_message.get('message_id')
+                    file_id = pinned_message['document']['file_id']
+                    if file_id == self._index_file_id and self._index is not None:
+                        return True  # Sin cambios desde la última carga/guardado
+                    
+                    content, message = self.download_file_by_id(file_id)
+                    if content is None:
+                        # No se sustituye el índice por uno vacío: el siguiente guardado
+                        # borraría del chat todas las entradas
+                        logger.error(f"Error descargando índice: {message}")
+                        return False
+                    
+                    if index_name == INDEX_FILENAME:
+                        content = gzip.decompress(content)
+                    self._set_index(orjson.loads(content), file_id)
+                    return True
+                
+                # El mensaje fijado no es un índice: el chat aún no tiene archivos
+                self._set_index({})
                 return True
+                
+            except Exception as e:
+                # Un fallo de red o un índice ilegible no descarta el índice ya cargado
+                logger.error(f"Error sincronizando índice: {e}")
+                return False
 
-            pinned_message = chat_info['result']['pinned_message']
-            self.index_message_id = pinned_message.get('message_id')
+    def _set_index(self, index, file_id=None):
+        # Índices antiguos solo tienen la fecha ISO: se añade el epoch una vez al cargar
+        for info in index.values():
+            if 'upload_ts' not in info:
+                info['upload_ts'] = int(datetime.fromisoformat(info['upload_date']).timestamp())
+        self._index = index
+        self._index_load_failed = False
+        self._index_file_id = file_id
+        self._saved_index_bytes = None
+        self._index_changed()
 
-            # Verificar si es nuestro archivo de índice
-            if ('document' in pinned_message and 
-                pinned_message['document']['file_name'] == INDEX_FILENAME):
-                
-                file_id = pinned_message['document']['file_id']
-                content, _ = self.download_file_by_id(file_id)
-                
-                if content:
-                    self.index = json.loads(content)
-                    return True
-            
-            self.index = {}
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error sincronizando índice: {e}")
-            self.index = {}
-            return False
+    def _replace_index(self, index):
+        """Publica una nueva versión del índice (llamar con _index_lock tomado).
+
+        El dict publicado nunca se modifica en el sitio: los lectores toman la
+        referencia actual sin candado y recorren una versión coherente aunque
+        otra sesión esté guardando el índice en Telegram.
+        """
+        self._index = index
+        self._index_changed()
+
+    def _index_changed(self):
+        """Invalida las vistas precalculadas tras modificar el índice"""
+        self._views = (None, {})
+        self._stats = None
+        self._names_by_hash = None
+        self._sizes = None
+        self._folded_names = (None, {})
+
+    def find_by_hash(self, file_hash):
+        """Devuelve el nombre de un archivo con ese contenido, o None (O(1) tras construir el mapa)"""
+        if self._names_by_hash is None:
+            self._names_by_hash = {}
+            for name, info in self.index.items():
+                self._names_by_hash.setdefault(info['hash'], name)
+        return self._names_by_hash.get(file_hash)
+
+    def has_size(self, size):
+        """Indica si algún archivo del índice tiene ese tamaño (solo esos pueden ser duplicados)"""
+        if self._sizes is None:
+            self._sizes = {info['size'] for info in self.index.values()}
+        return size in self._sizes
+
+    def get_stats(self):
+        """Número de archivos y tamaño total del índice, calculados una vez por versión"""
+        # Sin candado: un guardado en curso lo retiene durante llamadas de red
+        index = self.index
+        memo = self._stats
+        if memo is None or memo[0] is not index:
+            memo = (index, {
+                'count': len(index),
+                'total_size': sum(info['size'] for info in index.values())
+            })
+            self._stats = memo
+        return memo[1]
+
+    def get_sorted_files(self, sort_field, reverse=False, search=''):
+        """Devuelve [(nombre, info)] filtrado y ordenado, reutilizando vistas previas"""
+        needle = search.casefold()
+        key = (sort_field, reverse, needle)
+        # Sin candado: se trabaja sobre la versión actual del índice, que no cambia en el sitio
+        index = self.index
+        views_index, views = self._views
+        if views_index is not index:
+            views = {}
+            self._views = (index, views)
+        
+        view = views.get(key)
+        if view is not None:
+            return view
+        
+        # El orden completo se calcula una vez por versión del índice; la búsqueda filtra sobre él
+        ordered = views.get((sort_field, reverse, ''))
+        if ordered is None:
+            ordered = sorted(index.items(), key=SORT_KEYS[sort_field], reverse=reverse)
+            views[(sort_field, reverse, '')] = ordered
+        
+        if needle:
+            folded_index, folded = self._folded_names
+            if folded_index is not index:
+                folded = {name: name.casefold() for name in index}
+                self._folded_names = (index, folded)
+            view = [item for item in ordered if needle in folded[item[0]]]
+        else:
+            view = ordered
+        if len(views) >= MAX_CACHED_VIEWS:
+            views.clear()
+            views[(sort_field, reverse, '')] = ordered
+        views[key] = view
+        return view
 
     def save_index(self):
         """Guarda el índice en Telegram"""
@@ -165,129 +426,336 @@ class TelegramCloudStorage:
         
         try:
             # Subir nuevo índice
-            index_bytes = json.dumps(self.index, indent=2, separators=(',', ':')).encode('utf-8')
+            # JSON compacto + gzip: las claves repetidas comprimen muy bien
+            index_bytes = gzip.compress(orjson.dumps(self.index), mtime=0)
+            if self._index_file_id and index_bytes == self._saved_index_bytes:
+                return True  # El índice fijado ya tiene este contenido
+            
+            # Camino rápido: reemplazar el documento del mensaje ya fijado, solo si este
+            # cliente cargó o guardó ese documento (si no, se enviaría sobre uno desconocido)
+            if self.index_message_id and self._index_file_id and self._replace_index_document(index_bytes):
+                self._saved_index_bytes = index_bytes
+                return True
+            
             files = {'document': (INDEX_FILENAME, index_bytes)}
             data = {'chat_id': self.config['chat_id'], 'disable_notification': True}
             
-            response = requests.post(f"{self.base_url}/sendDocument", files=files, data=data, timeout=30)
-            if response.status_code != 200:
-                return False
-
-            result = response.json()
-            if not result['ok']:
-                return False
-
-            new_message_id = result['result']['message_id']
+            message = self._api('sendDocument', 'POST', files=files, data=data)
 
             # Desanclar anterior y fijar nuevo
             if self.index_message_id:
-                requests.post(f"{self.base_url}/unpinChatMessage", 
-                            data={'chat_id': self.config['chat_id'], 'message_id': self.index_message_id})
+                try:
+                    self._api('unpinChatMessage', 'POST',
+                              data={'chat_id': self.config['chat_id'], 'message_id': self.index_message_id})
+                except TelegramAPIError as e:
+                    logger.info(f"No se pudo desanclar el índice anterior: {e}")
 
-            pin_response = requests.post(f"{self.base_url}/pinChatMessage", 
-                                       data={'chat_id': self.config['chat_id'], 'message_id': new_message_id, 'disable_notification': True})
-            
-            if pin_response.json().get('ok'):
-                self.index_message_id = new_message_id
-                return True
-            else:
-                st.error("⚠️ El bot necesita permisos de administrador para fijar mensajes")
+            try:
+                self._api('pinChatMessage', 'POST',
+                          data={'chat_id': self.config['chat_id'], 'message_id': message['message_id'], 'disable_notification': True})
+            except TelegramAPIError:
+                # Puede ejecutarse en un hilo de trabajo: no usar st.* aquí
+                logger.warning("El bot necesita permisos de administrador para fijar mensajes")
                 return False
+            
+            self.index_message_id = message['message_id']
+            self._index_file_id = message['document']['file_id']
+            self._saved_index_bytes = index_bytes
+            return True
 
         except Exception as e:
             logger.error(f"Error guardando índice: {e}")
             return False
 
-    def upload_file(self, file_bytes, filename, remote_name=None):
-        """Sube archivo a Telegram"""
-        if len(file_bytes) > 2 * 1024 * 1024 * 1024:  # 2GB límite de Telegram
+    def _replace_index_document(self, index_bytes):
+        """Edita el mensaje de índice fijado con el nuevo contenido (1 llamada en vez de 3)"""
+        try:
+            media = {'type': 'document', 'media': 'attach://index'}
+            data = {
+                'chat_id': self.config['chat_id'],
+                'message_id': self.index_message_id,
+                'media': orjson.dumps(media)
+            }
+            files = {'index': (INDEX_FILENAME, index_bytes)}
+            
+            try:
+                message = self._api('editMessageMedia', 'POST', files=files, data=data)
+            except TelegramAPIError as e:
+                if 'not modified' in str(e):
+                    return True
+                logger.info(f"No se pudo editar el índice, se enviará uno nuevo: {e}")
+                return False
+            
+            self._index_file_id = message['document']['file_id']
+            return True
+        except Exception as e:
+            logger.warning(f"Error editando índice: {e}")
+            return False
+
+    def _ensure_fresh_index(self):
+        """Comprueba, antes de modificar el índice, que sigue siendo el fijado en el chat.
+
+        El cliente se comparte entre sesiones con el mismo token y otra instancia
+        puede haber fijado un índice nuevo: sync_index compara el file_id con un
+        getChat y solo vuelve a descargar el índice si ha cambiado.
+        """
+        return self.sync_index() and self.index_loaded
+
+    def _put_entry(self, remote_name, entry, save=True):
+        """Añade o reemplaza una entrada (llamar con _index_lock tomado).
+
+        Con save=True guarda el índice y, si falla, restaura la entrada anterior.
+        """
+        if save and not self._ensure_fresh_index():
+            return False
+        previous = self.index.get(remote_name)
+        self._replace_index({**self.index, remote_name: entry})
+        if not save or self.save_index():
+            return True
+        self._restore_entries({remote_name: previous})
+        return False
+
+    def _restore_entries(self, previous_entries):
+        """Deshace cambios en memoria: {nombre: entrada anterior o None si no existía}"""
+        index = dict(self.index)
+        for name, entry in previous_entries.items():
+            if entry is None:
+                index.pop(name, None)
+            else:
+                index[name] = entry
+        self._replace_index(index)
+
+    def _get_upload_hash(self, upload_id):
+        """Hash ya calculado para esa subida, o None"""
+        with self._upload_hashes_lock:
+            file_hash = self._upload_hashes.get(upload_id)
+            if file_hash is not None:
+                self._upload_hashes.move_to_end(upload_id)
+            return file_hash
+
+    def _remember_upload_hash(self, upload_id, file_hash):
+        """Recuerda el hash de una subida; el cliente vive mientras la app, así que se acota"""
+        with self._upload_hashes_lock:
+            self._upload_hashes[upload_id] = file_hash
+            self._upload_hashes.move_to_end(upload_id)
+            if len(self._upload_hashes) > MAX_UPLOAD_HASHES:
+                self._upload_hashes.popitem(last=False)
+
+    def upload_file(self, file_obj, filename, remote_name=None, save=True):
+        """Sube archivo a Telegram leyendo por bloques desde un objeto tipo archivo.
+
+        Con save=False solo se actualiza el índice en memoria (ver upload_files).
+        """
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(0)
+        if size > MAX_FILE_SIZE:
             return False, "Archivo demasiado grande (máximo 2GB)"
         
         if not self.config.get('chat_id'):
             return False, "Chat ID no configurado"
+        if not self.index_loaded:
+            return False, INDEX_NOT_LOADED_MESSAGE
         
         remote_name = remote_name or filename
-        file_hash = hashlib.md5(file_bytes).hexdigest()
+        # Los UploadedFile de Streamlit tienen un file_id único: no rehashear al reintentar
+        upload_id = getattr(file_obj, 'file_id', None)
+        file_hash = self._get_upload_hash(upload_id) if upload_id else None
+        # Solo un archivo del mismo tamaño puede ser duplicado: si no hay ninguno,
+        # el hash se calcula mientras se sube en vez de leer el archivo dos veces
+        with self._index_lock:
+            may_be_duplicate = self.has_size(size)
+        if file_hash is None and may_be_duplicate:
+            file_hash = hash_file(file_obj)
+            if upload_id:
+                self._remember_upload_hash(upload_id, file_hash)
         
         # Verificar si ya existe
-        if remote_name in self.index and self.index[remote_name]['hash'] == file_hash:
-            return True, f"Archivo '{remote_name}' ya existe"
+        if file_hash is not None:
+            with self._index_lock:
+                if remote_name in self.index and self.index[remote_name]['hash'] == file_hash:
+                    return True, f"Archivo '{remote_name}' ya existe"
+                
+                # Mismo contenido con otro nombre: reutilizar el file_id sin volver a subirlo
+                existing_name = self.find_by_hash(file_hash)
+                if existing_name:
+                    now = datetime.now()
+                    entry = {
+                        **self.index[existing_name],
+                        'upload_date': now.isoformat(),
+                        'upload_ts': int(now.timestamp()),
+                        'original_filename': filename
+                    }
+                    if self._put_entry(remote_name, entry, save):
+                        return True, f"Archivo '{remote_name}' guardado (contenido ya existente en '{existing_name}')"
+                    return False, "Error actualizando índice"
         
         try:
-            files = {'document': (filename, file_bytes)}
-            data = {
-                'chat_id': self.config['chat_id'],
-                'caption': f"☁️ {remote_name}\n🕒 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            }
+            # MultipartEncoder lee el archivo por bloques en vez de copiarlo entero al cuerpo
+            document = file_obj if file_hash else HashingReader(file_obj, size)
+            encoder = MultipartEncoder(fields={
+                'chat_id': str(self.config['chat_id']),
+                'caption': f"☁️ {remote_name}\n🕒 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                'document': (filename, document, 'application/octet-stream')
+            })
             
-            response = requests.post(f"{self.base_url}/sendDocument", files=files, data=data, timeout=60)
+            message = self._api('sendDocument', 'POST', data=encoder,
+                                headers={'Content-Type': encoder.content_type}, timeout=UPLOAD_TIMEOUT)
+            if file_hash is None:
+                file_hash = document.hexdigest()
+                if upload_id:
+                    self._remember_upload_hash(upload_id, file_hash)
             
-            if response.status_code == 200:
-                result = response.json()
-                if result['ok']:
-                    file_id = result['result']['document']['file_id']
-                    
-                    self.index[remote_name] = {
-                        'file_id': file_id,
-                        'hash': file_hash,
-                        'size': len(file_bytes),
-                        'upload_date': datetime.now().isoformat(),
-                        'original_filename': filename
-                    }
-                    
-                    if self.save_index():
-                        return True, f"Archivo '{remote_name}' subido exitosamente"
-                    else:
-                        del self.index[remote_name]
-                        return False, "Error actualizando índice"
-                else:
-                    return False, f"Error API: {result.get('description', 'Error desconocido')}"
-            else:
-                return False, f"Error HTTP: {response.status_code}"
+            # El índice se comparte entre subidas concurrentes
+            with self._index_lock:
+                now = datetime.now()
+                entry = {
+                    'file_id': message['document']['file_id'],
+                    'hash': file_hash,
+                    'size': size,
+                    'upload_date': now.isoformat(),
+                    'upload_ts': int(now.timestamp()),
+                    'original_filename': filename
+                }
+                if self._put_entry(remote_name, entry, save):
+                    return True, f"Archivo '{remote_name}' subido exitosamente"
+                return False, "Error actualizando índice"
                 
+        except TelegramAPIError as e:
+            return False, f"Error API: {e}"
         except Exception as e:
             return False, f"Error: {str(e)}"
 
-    def download_file_by_id(self, file_id):
-        """Descarga archivo por file_id"""
+    def upload_files(self, uploads, on_progress=None, max_workers=UPLOAD_WORKERS):
+        """Sube varios archivos en paralelo y guarda el índice una sola vez al final.
+
+        `uploads` es una lista de tuplas (file_obj, filename, remote_name).
+        Devuelve los resultados (success, message) en el mismo orden y llama
+        a `on_progress(completados, total)` desde el hilo que invoca.
+        """
+        results = [None] * len(uploads)
+        if not uploads:
+            return results
+        
+        with self._index_lock:
+            # Los hilos solo modifican el índice en memoria: se comprueba una vez para todo el lote
+            if not self._ensure_fresh_index():
+                return [(False, INDEX_NOT_LOADED_MESSAGE)] * len(uploads)
+            previous = {remote_name or filename: self.index.get(remote_name or filename)
+                        for _, filename, remote_name in uploads}
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(uploads))) as pool:
+            futures = {pool.submit(self.upload_file, *upload, save=False): i for i, upload in enumerate(uploads)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                if on_progress:
+                    on_progress(done, len(uploads))
+        
+        # Un único guardado del índice para todo el lote
+        with self._index_lock:
+            changed = any(self.index.get(name) is not entry for name, entry in previous.items())
+            if changed and not self.save_index():
+                self._restore_entries(previous)
+                results = [(False, "Error actualizando índice") if success else (success, message)
+                           for success, message in results]
+        return results
+
+    def download_to_cache(self, file_id):
+        """Descarga un file_id a la caché local por bloques y devuelve (ruta, mensaje)"""
+        # El file_id puede venir de un enlace compartido: validarlo antes de usarlo como ruta
+        if not isinstance(file_id, str) or not FILE_ID_PATTERN.fullmatch(file_id):
+            return None, "file_id no válido"
+        
+        cached_file = self.cache_dir / file_id
         try:
-            response = requests.get(f"{self.base_url}/getFile", params={'file_id': file_id})
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('ok'):
-                    file_path = result['result']['file_path']
-                    file_url = f"https://api.telegram.org/file/bot{self.bot_token}/{file_path}"
-                    
-                    file_response = requests.get(file_url, stream=True)
-                    if file_response.status_code == 200:
-                        return file_response.content, "Descarga exitosa"
-                    else:
-                        return None, f"Error descarga: {file_response.status_code}"
-                else:
-                    return None, f"Error API: {result.get('description')}"
-            else:
-                return None, f"Error HTTP: {response.status_code}"
+            try:
+                os.utime(cached_file)  # Marca de uso para la expulsión LRU
+                return cached_file, "Descarga exitosa (caché)"
+            except OSError:
+                pass  # No está en caché, o otra descarga acaba de expulsarlo: se pide de nuevo
+            
+            file_path = self._api('getFile', params={'file_id': file_id})['file_path']
+            file_url = f"{TELEGRAM_API}/file/bot{self.bot_token}/{file_path}"
+            
+            with self.session.get(file_url, stream=True, timeout=60) as file_response:
+                if file_response.status_code != 200:
+                    return None, f"Error descarga: {file_response.status_code}"
+                
+                # Se escribe en un temporal y se renombra: nunca queda un archivo a medias
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        for chunk in file_response.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                    os.replace(tmp_path, cached_file)
+                except BaseException:
+                    Path(tmp_path).unlink(missing_ok=True)
+                    raise
+            
+            self._prune_download_cache(keep=cached_file)
+            return cached_file, "Descarga exitosa"
+        except TelegramAPIError as e:
+            return None, f"Error API: {e}"
         except Exception as e:
             return None, f"Error: {str(e)}"
 
+    def download_file_by_id(self, file_id):
+        """Descarga archivo por file_id y devuelve su contenido"""
+        path, message = self.download_to_cache(file_id)
+        if path is None:
+            return None, message
+        return path.read_bytes(), message
+
+    def _prune_download_cache(self, keep):
+        """Expulsa las descargas menos usadas si la caché supera DOWNLOAD_CACHE_SIZE"""
+        try:
+            entries = []
+            for cached in self.cache_dir.iterdir():
+                if cached != keep and cached.suffix != '.tmp':
+                    stat = cached.stat()
+                    entries.append((stat.st_mtime, stat.st_size, cached))
+            
+            total = keep.stat().st_size + sum(size for _, size, _ in entries)
+            for _, size, old_file in sorted(entries):
+                if total <= DOWNLOAD_CACHE_SIZE:
+                    break
+                old_file.unlink(missing_ok=True)
+                total -= size
+        except OSError as e:
+            logger.warning(f"Error limpiando caché de descargas: {e}")
+
     def download_file(self, remote_name):
-        """Descarga archivo por nombre"""
+        """Descarga archivo por nombre a la caché local y devuelve (ruta, mensaje)"""
         if remote_name not in self.index:
             return None, f"Archivo '{remote_name}' no encontrado"
         
         file_id = self.index[remote_name]['file_id']
-        return self.download_file_by_id(file_id)
+        return self.download_to_cache(file_id)
 
     def delete_file(self, remote_name):
         """Elimina archivo del índice"""
         if remote_name not in self.index:
             return False, f"Archivo '{remote_name}' no encontrado"
         
+        success, message = self.delete_files([remote_name])
+        return success, (f"Archivo '{remote_name}' eliminado" if success else message)
+
+    def delete_files(self, remote_names):
+        """Elimina varios archivos del índice con un único guardado"""
         try:
-            del self.index[remote_name]
-            if self.save_index():
-                return True, f"Archivo '{remote_name}' eliminado"
-            else:
+            with self._index_lock:
+                if not self._ensure_fresh_index():
+                    return False, INDEX_NOT_LOADED_MESSAGE
+                index = dict(self.index)
+                removed = {name: index.pop(name) for name in remote_names if name in index}
+                if not removed:
+                    return False, "Ningún archivo encontrado"
+                
+                self._replace_index(index)
+                if self.save_index():
+                    return True, f"{len(removed)} archivo(s) eliminado(s)"
+                
+                self._restore_entries(removed)
                 return False, "Error actualizando índice"
         except Exception as e:
             return False, f"Error: {str(e)}"
@@ -308,8 +776,10 @@ class TelegramCloudStorage:
             }
             
             # Comprimir y codificar
-            json_data = json.dumps(minimal_data, separators=(',', ':'))
-            compressed = zlib.compress(json_data.encode())
+            json_data = orjson.dumps(minimal_data)
+            # Deflate crudo (sin cabecera ni adler32) y nivel 9: enlaces más cortos
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+            compressed = compressor.compress(json_data) + compressor.flush()
             encoded = base64.urlsafe_b64encode(compressed).decode().rstrip('=')
             
             # URL corta
@@ -321,6 +791,14 @@ class TelegramCloudStorage:
         except Exception as e:
             return None, f"Error generando enlace: {str(e)}"
 
+@st.cache_resource(show_spinner=False, max_entries=MAX_CLIENTS)
+def get_client(bot_token):
+    """Cliente por token, compartido entre reruns y sesiones (conserva índice y vistas).
+
+    Solo debe llamarse con tokens ya verificados con check_bot_token.
+    """
+    return TelegramCloudStorage(bot_token)
+
 def handle_shared_link():
     """Maneja la descarga desde enlace compartido"""
     if 'c' not in st.query_params:
@@ -336,8 +814,11 @@ def handle_shared_link():
         
         # Decodificar y descomprimir
         compressed = base64.urlsafe_b64decode(encoded_data)
-        json_data = zlib.decompress(compressed).decode()
-        minimal_data = json.loads(json_data)
+        try:
+            json_data = zlib.decompress(compressed)  # Enlaces antiguos con cabecera zlib
+        except zlib.error:
+            json_data = zlib.decompress(compressed, -15)
+        minimal_data = orjson.loads(json_data)
         
         st.title("📥 Descarga Compartida")
         st.markdown(f"**📄 Archivo:** {minimal_data['fn']}")
@@ -346,17 +827,21 @@ def handle_shared_link():
         
         if st.button("📥 Descargar Archivo", type="primary"):
             with st.spinner("Descargando..."):
-                # Crear cliente temporal
-                temp_client = TelegramCloudStorage(minimal_data['bt'])
-                content, message = temp_client.download_file_by_id(minimal_data['fid'])
+                # Cliente temporal: los tokens de enlaces no se guardan en get_client
+                if check_bot_token(minimal_data['bt'])[0]:
+                    share_client = TelegramCloudStorage(minimal_data['bt'])
+                    f, message = open_download(lambda: share_client.download_to_cache(minimal_data['fid']))
+                else:
+                    f, message = None, "Enlace no válido"
                 
-                if content:
-                    st.download_button(
-                        label="💾 Guardar Archivo",
-                        data=content,
-                        file_name=minimal_data['fn'],
-                        mime='application/octet-stream'
-                    )
+                if f:
+                    with f:
+                        st.download_button(
+                            label="💾 Guardar Archivo",
+                            data=f,
+                            file_name=minimal_data['fn'],
+                            mime='application/octet-stream'
+                        )
                     st.success("✅ Archivo listo para descargar")
                 else:
                     st.error(f"Error: {message}")
@@ -367,6 +852,47 @@ def handle_shared_link():
         st.error(f"Error procesando enlace: {str(e)}")
         return True
 
+def _new_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+def hash_file(file_obj):
+    """Calcula el hash BLAKE2b-128 por bloques y deja el archivo al inicio"""
+    file_obj.seek(0)
+    try:
+        # file_digest (Python 3.11+) hashea en C y, para BytesIO, sin copiar el buffer
+        hasher = hashlib.file_digest(file_obj, _new_hasher)
+    except (AttributeError, ValueError):
+        file_obj.seek(0)
+        hasher = _new_hasher()
+        for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    file_obj.seek(0)
+    return hasher.hexdigest()
+
+class HashingReader:
+    """Envuelve un archivo y calcula su hash BLAKE2b-128 a medida que se lee.
+
+    MultipartEncoder lee el cuerpo mientras `len` (bytes restantes) sea mayor que 0.
+    """
+
+    def __init__(self, file_obj, size):
+        self.file_obj = file_obj
+        self.size = size
+        self.hasher = _new_hasher()
+
+    @property
+    def len(self):
+        return self.size - self.file_obj.tell()
+
+    def read(self, size=-1):
+        chunk = self.file_obj.read(size)
+        self.hasher.update(chunk)
+        return chunk
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+@functools.lru_cache(maxsize=4096)
 def format_size(bytes_size):
     """Formatea tamaño de archivo"""
     if not isinstance(bytes_size, (int, float)): 
@@ -377,14 +903,191 @@ def format_size(bytes_size):
         bytes_size /= 1024
     return f"{bytes_size:.1f} TB"
 
-def create_zip_from_files(files_dict):
-    """Crea ZIP desde diccionario de archivos"""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for filename, file_bytes in files_dict.items():
-            zipf.writestr(filename, file_bytes)
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+@functools.lru_cache(maxsize=4096)
+def format_timestamp(ts, fmt='%d/%m/%Y %H:%M'):
+    """Formatea un epoch en hora local (memoizado: se repite en cada rerun)"""
+    return datetime.fromtimestamp(ts).strftime(fmt)
+
+def create_zip_from_files(file_objs):
+    """Crea un ZIP desde objetos tipo archivo (con .name) en un archivo temporal.
+
+    Los datos se copian por bloques y el ZIP pasa a disco si supera
+    ZIP_SPOOL_SIZE. El llamador debe cerrar el archivo devuelto.
+    """
+    zip_file = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE)
+    with zipfile.ZipFile(zip_file, 'w') as zipf:
+        for file_obj in file_objs:
+            file_obj.seek(0, os.SEEK_END)
+            size = file_obj.tell()
+            file_obj.seek(0)
+            
+            zinfo = zipfile.ZipInfo(file_obj.name, date_time=datetime.now().timetuple()[:6])
+            if Path(file_obj.name).suffix.lower() in INCOMPRESSIBLE_EXTENSIONS:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                zinfo._compresslevel = ZIP_COMPRESS_LEVEL  # Igual que hace ZipFile.writestr
+            
+            with zipf.open(zinfo, 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as entry:
+                shutil.copyfileobj(file_obj, entry, CHUNK_SIZE)
+    zip_file.seek(0)
+    return zip_file
+
+@st.fragment(run_every=1)
+def show_background_uploads():
+    """Muestra el estado de las subidas en segundo plano; se refresca sola cada segundo"""
+    uploads = st.session_state.get('background_uploads', [])
+    if not uploads:
+        return
+    
+    if all(future.done() for _, future in uploads):
+        st.session_state.upload_results = [(name, *future.result()) for name, future in uploads]
+        st.session_state.background_uploads = []
+        st.rerun()  # Rerun completo para refrescar la lista de archivos
+    
+    for name, future in uploads:
+        st.caption(f"{'✅' if future.done() else '⏳'} {name}")
+
+@st.fragment
+def show_file_browser(client, total_files):
+    """Búsqueda, tabla y acciones de "Mis Archivos".
+
+    Es un fragmento: buscar, ordenar, paginar o seleccionar solo reejecuta
+    este bloque, no la barra lateral ni las otras pestañas.
+    """
+    # Búsqueda y filtros
+    col1, col2 = st.columns(2)
+    with col1:
+        search = st.text_input("🔍 Buscar archivos:")
+    with col2:
+        sort_options = {
+            "Fecha ↓": ('date', True),
+            "Fecha ↑": ('date', False),
+            "Tamaño ↓": ('size', True),
+            "Tamaño ↑": ('size', False),
+            "Nombre A-Z": ('name', False),
+            "Nombre Z-A": ('name', True)
+        }
+        sort_by = st.selectbox("📊 Ordenar por:", sort_options.keys())
+    
+    # Filtrar y ordenar (vistas memoizadas en el cliente)
+    sort_field, reverse = sort_options[sort_by]
+    sorted_files = client.get_sorted_files(sort_field, reverse, search)
+    
+    if len(sorted_files) != total_files:
+        st.info(f"📋 Mostrando {len(sorted_files)} de {total_files} archivos")
+    
+    # Solo se envía al navegador la página visible
+    pages = max(1, (len(sorted_files) + PAGE_SIZE - 1) // PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, value=1)
+    page_files = sorted_files[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+    
+    # Mostrar archivos en una sola tabla; las acciones solo para el seleccionado
+    rows = [{
+        'Archivo': name,
+        'Tamaño': format_size(info['size']),
+        'Subido': format_timestamp(info['upload_ts'])
+    } for name, info in page_files]
+    
+    event = st.dataframe(rows, hide_index=True, use_container_width=True,
+                         on_select="rerun", selection_mode="multi-row", key=f"files_table_{page}")
+    selected_rows = [i for i in event.selection.rows if i < len(page_files)]
+    
+    if not selected_rows:
+        st.caption("👆 Selecciona un archivo para descargarlo, compartirlo o eliminarlo")
+    elif len(selected_rows) > 1:
+        names = [page_files[i][0] for i in selected_rows]
+        st.subheader(f"📄 {len(names)} archivos seleccionados")
+        
+        if st.button("🗑️ Eliminar seleccionados", key="del_selected"):
+            if st.session_state.get("confirm_del_selected") == names:
+                with st.spinner("Eliminando..."):
+                    success, message = client.delete_files(names)
+                    if success:
+                        st.success(f"✅ {message}")
+                        st.rerun()  # Rerun completo: cambian la tabla y las estadísticas
+                    else:
+                        st.error(message)
+            else:
+                st.session_state["confirm_del_selected"] = names
+                st.warning("⚠️ Click otra vez para confirmar")
+    else:
+        name, info = page_files[selected_rows[0]]
+        
+        show_file_actions(client, name, info)
+
+def open_download(download):
+    """Ejecuta `download()` -> (ruta, mensaje) y abre la ruta; devuelve (archivo, mensaje).
+
+    La caché de descargas se poda desde otras sesiones: si el archivo desaparece
+    entre la descarga y la apertura se descarga una vez más.
+    """
+    for _ in range(2):
+        path, message = download()
+        if path is None:
+            return None, message
+        try:
+            return open(path, 'rb'), message
+        except FileNotFoundError:
+            message = "El archivo se eliminó de la caché local durante la descarga"
+    return None, message
+
+def show_file_actions(client, name, info):
+    """Acciones sobre el archivo seleccionado (se ejecuta dentro de show_file_browser)"""
+    st.subheader(f"📄 {name}")
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        if st.button("📥 Descargar", key=f"dl_{name}"):
+            with st.spinner("Descargando..."):
+                f, message = open_download(lambda: client.download_file(name))
+                if f:
+                    with f:
+                        st.download_button(
+                            "💾 Guardar",
+                            data=f,
+                            file_name=name,
+                            key=f"save_{name}",
+                            type="primary"
+                        )
+                else:
+                    st.error(message)
+    
+    with col2:
+        if st.button("🔗 Compartir", key=f"share_{name}"):
+            with st.spinner("Generando enlace..."):
+                share_url, message = client.generate_share_link(name)
+                if share_url:
+                    st.code(share_url, language=None)
+                    st.success("✅ Enlace generado")
+                else:
+                    st.error(message)
+    
+    with col3:
+        if st.button("ℹ️ Información", key=f"info_{name}"):
+            st.info(f"""
+            **📄 Archivo:** {name}
+            **📊 Tamaño:** {format_size(info['size'])}
+            **📅 Subido:** {format_timestamp(info['upload_ts'], '%d/%m/%Y %H:%M:%S')}
+            **🆔 ID:** {info['file_id'][:20]}...
+            **#️⃣ Hash:** {info['hash'][:8]}...
+            """)
+    
+    with col4:
+        if st.button("🗑️ Eliminar", key=f"del_{name}"):
+            if st.session_state.get(f"confirm_del_{name}"):
+                with st.spinner("Eliminando..."):
+                    success, message = client.delete_file(name)
+                    if success:
+                        st.success("✅ Eliminado")
+                        st.rerun()  # Rerun completo: cambian la tabla y las estadísticas
+                    else:
+                        st.error(message)
+            else:
+                st.session_state[f"confirm_del_{name}"] = True
+                st.warning("⚠️ Click otra vez para confirmar")
 
 def main():
     # Verificar si es un enlace compartido
@@ -414,20 +1117,16 @@ def main():
         bot_token = st.text_input("🔑 Token del Bot:", type="password")
         
         if bot_token:
-            if not st.session_state.client or st.session_state.client.bot_token != bot_token:
-                st.session_state.client = TelegramCloudStorage(bot_token)
-            
-            client = st.session_state.client
-            is_valid, bot_info = client.test_bot_token()
+            is_valid, bot_info = check_bot_token(bot_token)
             
             if is_valid:
+                client = st.session_state.client = get_client(bot_token)
                 st.success(f"✅ Bot: {bot_info.get('first_name', 'Bot')}")
                 
                 if not client.config.get('chat_id'):
                     with st.spinner("Buscando chats..."):
-                        chats = client.get_chat_ids()
-                        if chats:
-                            chat_options = {name: id for id, name in chats}
+                        chat_options = client.get_chat_ids()
+                        if chat_options:
                             selected_chat = st.selectbox("Selecciona Chat:", chat_options.keys())
                             if st.button("💾 Guardar"):
                                 if client.save_config(chat_options[selected_chat]):
@@ -438,10 +1137,12 @@ def main():
                 else:
                     st.success("✅ Configurado")
                     if st.button("🔄 Reconfigurar"):
-                        client.config_file.unlink(missing_ok=True)
+                        client.reset_config()
+                        _cached_get_updates.clear()
                         st.session_state.client = None
                         st.rerun()
             else:
+                st.session_state.client = None
                 st.error("❌ Token inválido")
         else:
             st.info("👆 Ingresa tu token de bot")
@@ -459,6 +1160,16 @@ def main():
     with tab1:
         st.header("📤 Subir Archivos")
         
+        # Resultados de subidas en segundo plano ya terminadas
+        for name, success, message in st.session_state.pop('upload_results', []):
+            if success:
+                st.success(f"✅ {message}")
+            else:
+                st.error(f"❌ {name}: {message}")
+        # El fragmento se refresca cada segundo: solo se monta si hay subidas pendientes
+        if st.session_state.get('background_uploads'):
+            show_background_uploads()
+        
         uploaded_files = st.file_uploader("Selecciona archivos:", accept_multiple_files=True)
         
         if uploaded_files:
@@ -469,14 +1180,12 @@ def main():
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("📤 Subir Todos", type="primary"):
-                        success_count = 0
                         progress_bar = st.progress(0)
-                        for i, uploaded_file in enumerate(uploaded_files):
-                            file_bytes = uploaded_file.read()
-                            success, message = client.upload_file(file_bytes, uploaded_file.name)
-                            if success:
-                                success_count += 1
-                            progress_bar.progress((i + 1) / len(uploaded_files))
+                        results = client.upload_files(
+                            [(f, f.name, None) for f in uploaded_files],
+                            on_progress=lambda done, total: progress_bar.progress(done / total)
+                        )
+                        success_count = sum(1 for success, _ in results if success)
                         
                         st.success(f"✅ {success_count}/{len(uploaded_files)} archivos subidos")
                         if success_count > 0:
@@ -486,9 +1195,8 @@ def main():
                     zip_name = st.text_input("Nombre del ZIP:", value="archivos.zip")
                     if st.button("📦 Subir como ZIP"):
                         with st.spinner("Creando y subiendo ZIP..."):
-                            files_dict = {f.name: f.read() for f in uploaded_files}
-                            zip_bytes = create_zip_from_files(files_dict)
-                            success, message = client.upload_file(zip_bytes, zip_name)
+                            with create_zip_from_files(uploaded_files) as zip_file:
+                                success, message = client.upload_file(zip_file, zip_name)
                             if success:
                                 st.success(message)
                                 st.rerun()
@@ -512,15 +1220,12 @@ def main():
                 with col3:
                     st.write("")  # Espaciador
                     if st.button("📤", key=f"upload_{uploaded_file.name}"):
-                        with st.spinner("Subiendo..."):
-                            file_bytes = uploaded_file.read()
-                            success, message = client.upload_file(file_bytes, uploaded_file.name, custom_name)
-                        
-                        if success:
-                            st.success("✅")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ {message}")
+                        # La subida sigue en segundo plano; show_background_uploads informa al terminar
+                        future = get_upload_executor().submit(
+                            client.upload_file, uploaded_file, uploaded_file.name, custom_name
+                        )
+                        st.session_state.setdefault('background_uploads', []).append((custom_name, future))
+                        st.rerun()
 
     with tab2:
         col1, col2 = st.columns([3, 1])
@@ -532,102 +1237,17 @@ def main():
                     client.sync_index()
                 st.rerun()
         
-        if not client.index:
+        if not client.index_loaded and client.config.get('chat_id'):
+            st.error(f"❌ {INDEX_NOT_LOADED_MESSAGE}")
+        elif not client.index:
             st.info("📭 No hay archivos subidos")
         else:
             # Información básica
-            total_files = len(client.index)
-            total_size = sum(info['size'] for info in client.index.values())
+            stats = client.get_stats()
+            total_files, total_size = stats['count'], stats['total_size']
             st.info(f"📊 {total_files} archivos • {format_size(total_size)} total")
             
-            # Búsqueda y filtros
-            col1, col2 = st.columns(2)
-            with col1:
-                search = st.text_input("🔍 Buscar archivos:")
-            with col2:
-                sort_options = ["Fecha ↓", "Fecha ↑", "Tamaño ↓", "Tamaño ↑", "Nombre A-Z", "Nombre Z-A"]
-                sort_by = st.selectbox("📊 Ordenar por:", sort_options)
-            
-            # Filtrar archivos
-            filtered = {name: info for name, info in client.index.items() 
-                       if not search or search.lower() in name.lower()}
-            
-            # Ordenar archivos
-            sort_funcs = {
-                "Fecha ↓": lambda x: x[1]['upload_date'],
-                "Fecha ↑": lambda x: x[1]['upload_date'],
-                "Tamaño ↓": lambda x: x[1]['size'],
-                "Tamaño ↑": lambda x: x[1]['size'],
-                "Nombre A-Z": lambda x: x[0].lower(),
-                "Nombre Z-A": lambda x: x[0].lower()
-            }
-            
-            reverse = "↓" in sort_by or "Z-A" in sort_by
-            sorted_files = sorted(filtered.items(), key=sort_funcs[sort_by], reverse=reverse)
-            
-            if len(filtered) != total_files:
-                st.info(f"📋 Mostrando {len(sorted_files)} de {total_files} archivos")
-            
-            # Mostrar archivos
-            for name, info in sorted_files:
-                with st.container():
-                    col1, col2, col3, col4, col5 = st.columns([4, 1, 1, 1, 1])
-                    
-                    with col1:
-                        st.write(f"📄 **{name}**")
-                        upload_date = datetime.fromisoformat(info['upload_date'])
-                        st.caption(f"📅 {upload_date.strftime('%d/%m/%Y %H:%M')} • 📊 {format_size(info['size'])}")
-                    
-                    with col2:
-                        if st.button("📥", key=f"dl_{name}", help="Descargar"):
-                            with st.spinner("Descargando..."):
-                                content, message = client.download_file(name)
-                                if content:
-                                    st.download_button(
-                                        "💾 Guardar",
-                                        data=content,
-                                        file_name=name,
-                                        key=f"save_{name}",
-                                        type="primary"
-                                    )
-                                else:
-                                    st.error(message)
-                    
-                    with col3:
-                        if st.button("🔗", key=f"share_{name}", help="Compartir"):
-                            with st.spinner("Generando enlace..."):
-                                share_url, message = client.generate_share_link(name)
-                                if share_url:
-                                    st.code(share_url, language=None)
-                                    st.success("✅ Enlace generado")
-                                else:
-                                    st.error(message)
-                    
-                    with col4:
-                        if st.button("ℹ️", key=f"info_{name}", help="Información"):
-                            st.info(f"""
-                            **📄 Archivo:** {name}
-                            **📊 Tamaño:** {format_size(info['size'])}
-                            **📅 Subido:** {upload_date.strftime('%d/%m/%Y %H:%M:%S')}
-                            **🆔 ID:** {info['file_id'][:20]}...
-                            **#️⃣ Hash:** {info['hash'][:8]}...
-                            """)
-                    
-                    with col5:
-                        if st.button("🗑️", key=f"del_{name}", help="Eliminar"):
-                            if st.session_state.get(f"confirm_del_{name}"):
-                                with st.spinner("Eliminando..."):
-                                    success, message = client.delete_file(name)
-                                    if success:
-                                        st.success("✅ Eliminado")
-                                        st.rerun()
-                                    else:
-                                        st.error(message)
-                            else:
-                                st.session_state[f"confirm_del_{name}"] = True
-                                st.warning("⚠️ Click otra vez para confirmar")
-                    
-                    st.divider()
+            show_file_browser(client, total_files)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()